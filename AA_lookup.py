@@ -56,6 +56,24 @@ Codon_Table = {
 }
 
 
+# --- Packed Codon Table ---
+# The same genetic code, indexed by number instead of by codon string.
+# Each base is given a 2-bit code (A=0, C=1, G=2, T=3) — matching the packed sequence
+# encoding in dna_packing.py — so every codon becomes an integer from 0 to 63:
+# (first base << 4) | (second base << 2) | third base.
+# AA_Names lists each amino acid once, in codon table order, followed by "Stop" (20).
+# Packed_Codon_Table holds the AA_Names position for each of the
+# 64 packed codons, letting translation replace a string lookup with a single index.
+Base_Codes = {"A": 0, "C": 1, "G": 2, "T": 3}
+
+AA_Names = tuple(aa for aa in dict.fromkeys(Codon_Table.values()) if aa != "Stop") + ("Stop",)
+
+_packed_codons = [0] * 64
+for _codon, _amino_acid in Codon_Table.items():
+    _packed_codons[(Base_Codes[_codon[0]] << 4) | (Base_Codes[_codon[1]] << 2) | Base_Codes[_codon[2]]] = AA_Names.index(_amino_acid)
+Packed_Codon_Table = tuple(_packed_codons)
+
+
 # --- Amino Acid Properties ---
 # Maps each amino acid (3-letter code) to its chemical property classification.
 # These properties describe the behaviour of the amino acid's side chain (R group)
@@ -0,0 +1,85 @@
+# dna_packing.py
+# Compact 2-bit encoding of DNA nucleotide sequences.
+# Each base is stored in 2 bits (A=00, C=01, G=10, T=11), packing four bases into a
+# single byte — a quarter of the space taken by the ASCII sequence string. Sequences are
+# held in memory only in this packed form; analyses that scan the whole sequence (GC
+# content, codon translation) work on it directly, and the ASCII string is rebuilt on demand.
+# Packed sequences are written to sequences.txt as base64 text, since JSON has no bytes
+# type, which takes four characters per three packed bytes — about a third of the space
+# of the ASCII sequence string on disk.
+
+import base64
+import numpy as np
+
+
+# --- Base Code Lookup Table ---
+# Maps each ASCII byte to its 2-bit base code (A=0, C=1, G=2, T=3, either case).
+# Any byte that is not a valid base maps to 255.
+NUC2BIT = np.full(256, 255, dtype=np.uint8)
+NUC2BIT[[ord(c) for c in "ACGTacgt"]] = [0, 1, 2, 3, 0, 1, 2, 3]
+
+
+# --- Packed Byte Lookup Tables ---
+# _UNPACK maps each packed byte to the four base codes it holds, first base first.
+# _UNPACK_ASCII maps each packed byte to the four ASCII base letters it holds.
+# _GC_PER_BYTE maps each packed byte to how many of its four bases are G or C —
+# these are exactly the 2-bit codes whose two bits differ (C=01, G=10).
+_byte_values = np.arange(256, dtype=np.uint8)
+_UNPACK = np.stack([(_byte_values >> shift) & 3 for shift in (6, 4, 2, 0)], axis=1)
+_UNPACK_ASCII = np.frombuffer(b"ACGT", dtype=np.uint8)[_UNPACK]
+_GC_PER_BYTE = ((_UNPACK == 1) | (_UNPACK == 2)).sum(axis=1).astype(np.uint8)
+
+
+# --- Base Codes ---
+# Looks up the 2-bit code of every byte of an ASCII sequence in one vectorised pass.
+# Any code above 3 (i.e. 255) marks a byte that is not a valid base, so the same array
+# serves to validate a sequence and then to pack it.
+def base_codes(sequence: bytes) -> np.ndarray:
+    return NUC2BIT[np.frombuffer(sequence, dtype=np.uint8)]
+
+
+# --- Pack Sequence ---
+# Converts a DNA sequence string into its 2-bit packed bytes. The final byte is padded
+# with A (00) codes, so the original sequence length must be kept alongside it.
+def pack2bit(sequence: str) -> bytes:
+    return pack_codes(base_codes(sequence.encode("ascii")))
+
+
+# Packs an array of base codes (as returned by base_codes) four to a byte
+def pack_codes(codes: np.ndarray) -> bytes:
+    codes = codes & 3
+    codes = np.concatenate([codes, np.zeros(-len(codes) % 4, dtype=np.uint8)]).reshape(-1, 4)
+    packed = (codes[:, 0] << 6) | (codes[:, 1] << 4) | (codes[:, 2] << 2) | codes[:, 3]
+    return packed.tobytes()
+
+
+# --- Unpack Sequence ---
+# Expands packed bytes back into an array of 2-bit base codes (one code per byte),
+# dropping the padding beyond the original sequence length.
+def unpack2bit(packed: bytes, length: int) -> np.ndarray:
+    return _UNPACK[np.frombuffer(packed, dtype=np.uint8)].reshape(-1)[:length]
+
+
+# --- Unpack Sequence String ---
+# Rebuilds the uppercase ASCII sequence string from packed bytes, four letters per byte
+# looked up at once, dropping the padding beyond the original sequence length.
+def unpack_to_string(packed: bytes, length: int) -> str:
+    return _UNPACK_ASCII[np.frombuffer(packed, dtype=np.uint8)].tobytes()[:length].decode("ascii")
+
+
+# --- Count GC Bases ---
+# Counts G and C bases directly from the packed bytes, touching one byte per four bases.
+# Padding codes are A, so they never contribute to the count.
+def count_gc(packed: bytes) -> int:
+    return int(_GC_PER_BYTE[np.frombuffer(packed, dtype=np.uint8)].sum())
+
+
+# --- Storage Encoding ---
+# Converts packed bytes to and from the base64 text stored in each JSON line of
+# sequences.txt. Only the file is base64 encoded; records in memory hold the bytes.
+def encode_packed(packed: bytes) -> str:
+    return base64.b64encode(packed).decode("ascii")
+
+
+def decode_packed(text: str) -> bytes:
+    return base64.b64decode(text)
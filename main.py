@@ -4,12 +4,20 @@
 #   - sequences router: handles all sequence management (create, list, fetch, update, delete)
 #   - analysis router: handles all biological analysis (nucleotide, amino acid, summary stats)
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
 from routes import analysis, sequences
 
 # The 'app' variable is what uvicorn looks for when starting the server
 app = FastAPI(title="DNA Sequence Toolkit API")
 
+# Every endpoint is a plain (sync) function, which FastAPI runs in its threadpool. Besides
+# their storage calls, most endpoints do CPU-bound work that grows with the sequences
+# involved (packing, decoding, GC counting, codon translation, serialising the response),
+# which would block the event loop for every other request if run in an async endpoint.
+
 # Register the sequences router under the /sequences prefix
 app.include_router(sequences.router, prefix="/sequences", tags=["Sequence Management"])
 
@@ -17,6 +25,19 @@ app.include_router(sequences.router, prefix="/sequences", tags=["Sequence Manage
 app.include_router(analysis.router, prefix="/analysis", tags=["DNA Analysis"])
 
 
+# --- Request Validation Errors ---
+# Field validators in schema.py (e.g. rejecting an empty label) raise ValueError with the
+# toolkit's own error message. These are returned as a 400 with that message as the detail,
+# matching the errors raised inside the endpoints. If the request has any other validation
+# error (a missing field, a wrong type), FastAPI's default 422 response is returned instead.
+@app.exception_handler(RequestValidationError)
+async def validation_error_handler(request: Request, exc: RequestValidationError):
+    errors = exc.errors()
+    if all(error["type"] == "value_error" and error["loc"][0] == "body" for error in errors):
+        return JSONResponse(status_code=400, content={"detail": str(errors[0]["ctx"]["error"])})
+    return await request_validation_exception_handler(request, exc)
+
+
 # --- Root Endpoint ---
 # A simple health check endpoint to confirm the API is running.
 # Also provides a brief description of what the toolkit does.
@@ -4,20 +4,125 @@
 
 from fastapi import APIRouter, HTTPException
 from schema import NucleotideResult, AminoAcidResult, SummaryStats
-from storage import load_sequences, save_sequences
-from AA_lookup import AA_Properties, Codon_Table
-from statistics import mean
+from storage import find_sequence, load_sequences_soa, update_sequence
+from AA_lookup import AA_Properties, AA_Names, Packed_Codon_Table
+from dna_packing import unpack2bit, count_gc
+from collections import Counter
+import numpy as np
+
+# Numba is optional — when installed, the codon translation loop is JIT-compiled to
+# native code. Without it, an equivalent vectorised NumPy version is used instead.
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 router = APIRouter()
 
 # --- Helper Function ---
-# Calculates GC content (proportion of G and C bases) and total length of a sequence.
+# Calculates GC content (proportion of G and C bases) and total length of a stored sequence.
 # GC content is biologically significant as it affects thermal stability and primer design.
-def calculate_gc(sequence: str) -> float:
-     sequence = sequence.upper()
-     seq_length = len(sequence)
-     gc_content = round((sequence.count("G") + sequence.count("C")) / seq_length, 4)
-     return gc_content, seq_length
+# The stored packed sequence is counted four bases per byte.
+def calculate_gc(sequence: dict) -> tuple[float, int]:
+    seq_length = sequence["packed_length"]
+    gc_count = count_gc(sequence["packed_sequence"])
+    gc_content = round(gc_count / seq_length, 4)
+    return gc_content, seq_length
+
+
+# --- Codon Lookup Table ---
+# The packed codon table from AA_lookup as a 64-byte NumPy array, so the translation
+# kernels can index it directly. Codes are positions in AA_Names, where Stop is code 20.
+_STOP = AA_Names.index("Stop")
+_CODON64 = np.array(Packed_Codon_Table, dtype=np.uint8)
+
+
+# --- Helper Function: Codon Translation ---
+# Translates an array of 2-bit base codes into an array of amino acid codes (positions in
+# AA_Names), reading one codon at a time. Translation stops at the first Stop codon and
+# any incomplete codon at the end is ignored.
+# Sequences are validated to contain only A, T, C and G when they are created, so every
+# code is a valid 2-bit base and codons index the table directly with no invalid-base check.
+def _translate_codons(codes, codon_lut):
+    amino_codes = np.empty(len(codes) // 3, dtype=np.uint8)
+    j = 0
+    for i in range(0, len(codes) - 2, 3):
+        amino_code = codon_lut[(codes[i] << 4) | (codes[i + 1] << 2) | codes[i + 2]]
+        if amino_code == _STOP:  # Stop codon terminates translation
+            break
+        amino_codes[j] = amino_code
+        j += 1
+    return amino_codes[:j]
+
+
+# The Stop code as a single byte, for finding the first Stop in a uint8 code array
+_STOP_BYTE = bytes([_STOP])
+
+
+# Vectorised equivalent of _translate_codons, used when Numba is not installed.
+# Packs every complete codon at once, then truncates the result at the first Stop codon.
+# Stop is the single byte value 20 in the uint8 codes, so the first one is found with one
+# bytes.find call (a C-level memchr that stops at the first match) rather than building
+# and scanning a comparison mask over the whole array.
+def _translate_codons_numpy(codes, codon_lut):
+    codons = codes[:len(codes) - len(codes) % 3].reshape(-1, 3)
+    amino_codes = codon_lut[(codons[:, 0] << 4) | (codons[:, 1] << 2) | codons[:, 2]]
+    stop = amino_codes.tobytes().find(_STOP_BYTE)
+    if stop != -1:
+        amino_codes = amino_codes[:stop]
+    return amino_codes
+
+
+translate_codons = njit(cache=True)(_translate_codons) if njit is not None else _translate_codons_numpy
+
+
+# --- Helper Function: Join Amino Acid Names ---
+# Builds the dash-separated amino acid sequence (e.g. "Met-Glu-Ala") straight from the
+# uint8 amino acid codes. _AA_NAME_BYTES holds each 3-letter name plus a trailing dash as
+# a fixed 4-byte entry, so indexing it with the codes lays out the whole joined string in
+# one contiguous buffer; the final dash is then dropped. No per-residue Python strings
+# are created. Stop never appears in translated output, so its truncated entry is unused.
+_AA_NAME_BYTES = np.array([f"{name}-".encode("ascii") for name in AA_Names], dtype="S4")
+
+
+def join_amino_acids(amino_codes: np.ndarray) -> str:
+    return _AA_NAME_BYTES[amino_codes].tobytes()[:-1].decode("ascii")
+
+
+# --- Helper Function: Translate and Analyse ---
+# Runs the whole amino acid pipeline on an array of 2-bit base codes: translates the codons,
+# then counts each residue and each chemical property type. Residue counting is done on the
+# uint8 amino acid codes with np.unique, so no per-residue Python work is needed; the counts
+# are kept in the order each residue first appears, so ties in the top 3 resolve as before.
+# Returns the amino acid codes, the property composition, and the per-residue counts.
+def translate_and_analyze(codes: np.ndarray) -> tuple[np.ndarray, dict, Counter]:
+    # Converts the DNA nucleotide sequence into an amino acid sequence
+    # by reading codons (triplets of bases) and looking them up in the codon table
+    amino_codes = translate_codons(codes, _CODON64)
+
+    # Counts occurrences of each individual amino acid residue
+    present, first_seen, counts = np.unique(amino_codes, return_index=True, return_counts=True)
+    order = np.argsort(first_seen)
+    residue_counts = Counter(dict(zip((AA_Names[code] for code in present[order].tolist()), counts[order].tolist())))
+
+    # Determines the chemical property of each residue and counts how many of each
+    # property type appear in the sequence, working from the per-residue counts
+    composition = Counter()
+    for aa, count in residue_counts.items():
+        composition[AA_Properties.get(aa, "Unknown")] += count
+
+    return amino_codes, dict(composition), residue_counts
+
+
+# --- Helper Function: Sequence Lookup ---
+# Returns the stored record matching the given ID via the storage layer's cached id map,
+# so the endpoints do a single lookup rather than comparing every record.
+# Raises a 404 with the endpoint-specific detail message if the ID does not exist.
+def _find_sequence(id: int, detail: str) -> dict:
+    sequence = find_sequence(id)
+    if sequence is None:
+        raise HTTPException(status_code=404, detail=detail)
+    return sequence
 
 
 # --- Nucleotide Analysis Endpoint ---
@@ -26,24 +131,56 @@ def calculate_gc(sequence: str) -> float:
 # Sets nuc_analysed to True so the sequence can be filtered and counted in summary stats.
 @router.get("/{id}/nucleotide", response_model=NucleotideResult)
 def nucleotide_analysis(id: int):
-    all_sequences = load_sequences()
-    for sequence in all_sequences:
-        if id == sequence["id"]:
-            gc_content, seq_length = calculate_gc(sequence["sequence"])
-            sequence["gc_content"] = gc_content
-            sequence["seq_length"] = seq_length
-            sequence["nuc_analysed"] = True
-            save_sequences(all_sequences)
-            
-            return {
-                "message": f"DNA Nucleotide sequence with ID:{id} successfully analysed. See below the length of the sequence and its total GC content, which can be used to design primer melting and annealing temperatures",
-                "sequence_id": id,
-                "label": sequence["label"],
-                "length": seq_length,
-                "gc_content": gc_content
-            }
     # Raised if no sequence with the given ID exists
-    raise HTTPException(status_code=404, detail=f"Analysis could not be performed on sequence ID:{id}: ID not found")
+    not_found = f"Analysis could not be performed on sequence ID:{id}: ID not found"
+    sequence = _find_sequence(id, not_found)
+
+    gc_content, seq_length = calculate_gc(sequence)
+    # Saved only if the analysed record is still stored — it may have been deleted (and
+    # its ID reused by a new sequence) while the analysis was running
+    if update_sequence(id, {"gc_content": gc_content, "seq_length": seq_length, "nuc_analysed": True}, expected=sequence) is None:
+        raise HTTPException(status_code=404, detail=not_found)
+
+    return {
+        "message": f"DNA Nucleotide sequence with ID:{id} successfully analysed. See below the length of the sequence and its total GC content, which can be used to design primer melting and annealing temperatures",
+        "sequence_id": id,
+        "label": sequence["label"],
+        "length": seq_length,
+        "gc_content": gc_content
+    }
+
+
+# The amino acid analysis results kept on each stored record and returned by the endpoint
+_AA_RESULT_FIELDS = ("amino_acid_sequence", "residue_count", "composition", "top_3_residues")
+
+
+# --- Helper Function: Amino Acid Conversion ---
+# Translates a stored sequence and calculates its composition and top 3 residues.
+# Returns the result fields shared by the stored record and the endpoint response.
+# Raises a 400 if translation produces no amino acids.
+def _convert_to_amino_acids(id: int, sequence: dict) -> dict:
+    codes = unpack2bit(sequence["packed_sequence"], sequence["packed_length"])
+    amino_codes, composition, residue_counts = translate_and_analyze(codes)
+
+    # If translation produced no amino acids (e.g. sequence starts with a stop codon)
+    if amino_codes.size < 1:
+        raise HTTPException(status_code=400, detail=f"Nucleotide sequence ID:{id} consisted only of a STOP codon. Therefore, conversion to Amino Acids produced no viable sequence.")
+
+    residue_count = amino_codes.size
+
+    # Takes the top 3 most common residues directly from the counts and converts
+    # each count to a percentage of the total sequence length
+    top_3_residues = [
+        {"residue": aa, "percentage": round((count / residue_count) * 100, 2)}
+        for aa, count in residue_counts.most_common(3)
+    ]
+
+    return {
+        "amino_acid_sequence": join_amino_acids(amino_codes),
+        "residue_count": residue_count,
+        "composition": composition,
+        "top_3_residues": top_3_residues
+    }
 
 
 # --- Amino Acid Analysis Endpoint ---
@@ -51,69 +188,30 @@ def nucleotide_analysis(id: int):
 # Codons are read in triplets; translation stops at a Stop codon or incomplete codon.
 # Calculates amino acid composition by property type and identifies the top 3 most
 # frequent residues. Updates the record in storage and sets aa_analysed to True.
+# Only a sequence's label can change after creation, so if it has already been converted
+# the stored results are returned directly rather than translating it again.
 @router.get("/{id}/aminoacid", response_model=AminoAcidResult)
 def aminoacid_analysis(id: int):
-    all_sequences = load_sequences()
-    for sequence in all_sequences:
-        if id == sequence["id"]:
-            amino_acids = []
-            dna_str = sequence["sequence"].upper()
-
-            # Converts the DNA nucleotide sequence into an amino acid sequence
-            # by reading codons (triplets of bases) and looking them up in the codon table
-            for i in range(0, len(dna_str), 3):
-                codon = dna_str[i:i+3]
-                if len(codon) < 3:  # Ignore incomplete codons at the end
-                    break
-                amino_acid = Codon_Table.get(codon, "Unknown")
-                if amino_acid == "Stop":  # Stop codon terminates translation
-                    break
-                amino_acids.append(amino_acid)
-            
-            # If translation produced no amino acids (e.g. sequence starts with a stop codon)
-            if len(amino_acids) < 1:
-                raise HTTPException(status_code=400, detail=f"Nucleotide sequence ID:{id} consisted only of a STOP codon. Therefore, conversion to Amino Acids produced no viable sequence.")
-
-            # Determines the chemical property of each amino acid and counts
-            # how many of each property type appear in the sequence
-            composition = {}
-            for amino_acid in amino_acids:
-                aa_property = AA_Properties.get(amino_acid, "Unknown")
-                composition[aa_property] = composition.get(aa_property, 0) + 1
-            
-            # Counts occurrences of each individual amino acid residue
-            residue_counts = {}
-            for amino_acid in amino_acids:
-                residue_counts[amino_acid] = residue_counts.get(amino_acid, 0) + 1
-            
-            # Converts raw counts to percentages of the total sequence length
-            residue_percentages = {}   
-            for aa, count in residue_counts.items():
-                residue_percentages[aa] = round((count / len(amino_acids)) * 100, 2)
-            
-            # Sorts by percentage descending and takes the top 3 most common residues
-            top_3_residues = sorted(residue_percentages.items(), key=lambda x: x[1], reverse=True)[:3]
-            top_3_residues = [{"residue": aa, "percentage": pct} for aa, pct in top_3_residues]
-
-            # Saves analysis results back to storage and marks sequence as AA analysed
-            sequence["amino_acid_sequence"] = "-".join(amino_acids)
-            sequence["residue_count"] = len(amino_acids)
-            sequence["composition"] = composition
-            sequence["top_3_residues"] = top_3_residues
-            sequence["aa_analysed"] = True
-            save_sequences(all_sequences)
-
-            return {
-                "message": f"DNA Nucleotide conversion to Amino Acid sequence with ID:{id} successfully completed. See below the converted sequence, the Amino Acid sequence length, the proportion of the different types of Amino Acid properties present in the sequence, and the top 3 most common Amino Acid Residues.",
-                "sequence_id": id,
-                "label": sequence["label"],
-                "amino_acid_sequence": "-".join(amino_acids),
-                "residue_count": len(amino_acids),
-                "composition": composition,
-                "top_3_residues": top_3_residues
-            }
     # Raised if no sequence with the given ID exists
-    raise HTTPException(status_code=404, detail=f"DNA to Amino Acid sequence conversion could not be performed on sequence ID:{id}: ID not found")
+    not_found = f"DNA to Amino Acid sequence conversion could not be performed on sequence ID:{id}: ID not found"
+    sequence = _find_sequence(id, not_found)
+
+    if sequence.get("aa_analysed") and all(sequence.get(field) is not None for field in _AA_RESULT_FIELDS):
+        results = {field: sequence[field] for field in _AA_RESULT_FIELDS}
+    else:
+        results = _convert_to_amino_acids(id, sequence)
+        # Saves analysis results back to storage and marks sequence as AA analysed — only if
+        # the translated record is still stored (it may have been deleted, and its ID reused
+        # by a new sequence, while the translation was running)
+        if update_sequence(id, {**results, "aa_analysed": True}, expected=sequence) is None:
+            raise HTTPException(status_code=404, detail=not_found)
+
+    return {
+        "message": f"DNA Nucleotide conversion to Amino Acid sequence with ID:{id} successfully completed. See below the converted sequence, the Amino Acid sequence length, the proportion of the different types of Amino Acid properties present in the sequence, and the top 3 most common Amino Acid Residues.",
+        "sequence_id": id,
+        "label": sequence["label"],
+        **results
+    }
 
 
 # --- Summary Statistics Endpoint ---
@@ -124,41 +222,45 @@ def aminoacid_analysis(id: int):
 # If no AA analysis has been performed, average_amino_acid_length returns as null.
 @router.get("/summary_statistics", response_model=SummaryStats)
 def summary_analysis():
-    all_sequences = load_sequences()
+    columns = load_sequences_soa()
+    labels = columns["label"]
 
     # Raised if the toolkit has no sequences stored at all
-    if len(all_sequences) == 0:
+    if len(labels) == 0:
         raise HTTPException(status_code=404, detail="Summary statistics cannot be calculated: No nucleotide sequences have been submitted to DNA Toolkit.")
 
     # Filter to only sequences that have had nucleotide analysis performed
-    analysed_nuc_seqs = [s for s in all_sequences if s.get("gc_content") is not None]
+    # (un-analysed sequences hold NaN in the analysis columns)
+    nuc_analysed = np.flatnonzero(~np.isnan(columns["gc_content"]))
+    n_nuc = nuc_analysed.size
 
     # Raised if sequences exist but none have been nucleotide analysed yet
-    if len(analysed_nuc_seqs) == 0:
+    if n_nuc == 0:
         raise HTTPException(status_code=404, detail="Summary statistics cannot be calculated: No nucleotide sequences currently stored in the DNA Toolkit have undergone analysis.")
 
     # Calculate nucleotide summary statistics across all nucleotide-analysed sequences
-    av_gc = mean([s["gc_content"] for s in analysed_nuc_seqs])
-    av_nuc_length = mean([s["seq_length"] for s in analysed_nuc_seqs])
-    longest_nucseq = max(analysed_nuc_seqs, key=lambda x: x["seq_length"])
-    shortest_nucseq = min(analysed_nuc_seqs, key=lambda x: x["seq_length"])
+    gc_content = columns["gc_content"][nuc_analysed]
+    seq_length = columns["seq_length"][nuc_analysed]
+    av_gc = float(gc_content.mean())
+    av_nuc_length = float(seq_length.mean())
+    longest_nucseq = labels[nuc_analysed[seq_length.argmax()]]
+    shortest_nucseq = labels[nuc_analysed[seq_length.argmin()]]
 
     # Filter to only sequences that have had amino acid analysis performed
     # If none have, average amino acid length is returned as null rather than raising an error
-    analysed_aa_seqs = [s for s in all_sequences if s.get("residue_count") is not None]
-    if len(analysed_aa_seqs) == 0:
-        av_aa_length = None
-    else:
-        av_aa_length = mean([s["residue_count"] for s in analysed_aa_seqs])
-    
+    residue_count = columns["residue_count"]
+    residue_count = residue_count[~np.isnan(residue_count)]
+    n_aa = residue_count.size
+    av_aa_length = float(residue_count.mean()) if n_aa else None
+
     return {
         "message": "Summary of key statistics of all sequences currently stored in DNA Toolkit. If a statistic is missing, it is likely due to GC content analysis or Amino Acid conversion not having been performed yet.",
-        "total_sequences": len(all_sequences),
-        "nuc_analysed_sequences": len(analysed_nuc_seqs),
-        "aa_analysed_sequences": len(analysed_aa_seqs),
+        "total_sequences": len(labels),
+        "nuc_analysed_sequences": n_nuc,
+        "aa_analysed_sequences": n_aa,
         "average_gc_content": av_gc,
         "average_nucleotide_length": av_nuc_length,
         "average_amino_acid_length": av_aa_length,
-        "longest_nucleotide_sequence": longest_nucseq["label"],
-        "shortest_nucleotide_sequence": shortest_nucseq["label"]
+        "longest_nucleotide_sequence": longest_nucseq,
+        "shortest_nucleotide_sequence": shortest_nucseq
     }
\ No newline at end of file
@@ -2,25 +2,56 @@
 # Contains all endpoints for managing DNA sequence entries — creating, listing,
 # fetching, updating, and deleting sequences stored in sequences.txt.
 
-from fastapi import APIRouter, HTTPException
+import numpy as np
+import orjson
+from fastapi import APIRouter, HTTPException, Response
 from schema import NucSeqCreate, NucSeqUpdate, NucSeq, NucSeqSummary
-from storage import load_sequences, save_sequences
+from storage import load_sequences_soa, find_sequence, sequence_string, save_sequences, append_sequence, update_sequence, delete_sequence
+from dna_packing import base_codes, pack_codes
 
 router = APIRouter()
 
+# Byte translation table that uppercases the four DNA bases and passes every other byte
+# through unchanged. Sequences are normalised with bytes.translate rather than str.upper,
+# avoiding full Unicode case mapping for what should be plain ASCII input.
+_UPPER = bytes.maketrans(b"acgt", b"ACGT")
+
+# Fields of the response models, in output order. The endpoints build their JSON directly
+# from these (see _json_response), so stored-only fields such as packed_sequence are still
+# left out of the response.
+_NUCSEQ_FIELDS = tuple(NucSeq.model_fields)
+_SUMMARY_FIELDS = tuple(NucSeqSummary.model_fields)
+
+
+# Serialises already-shaped response data with orjson and returns it as-is. FastAPI passes
+# a returned Response straight through, skipping jsonable_encoder and response model
+# validation; any response model declared on the route is then only used for the API docs.
+def _json_response(content):
+    return Response(content=orjson.dumps(content), media_type="application/json")
+
+
+# Builds the NucSeq response for a stored sequence, decoding its sequence string.
+# Analysis fields not yet set on the record are returned as null, as NucSeq would, unless
+# exclude_none is set, in which case they are left out (as response_model_exclude_none would).
+def _nucseq_response(sequence, message, exclude_none=False):
+    response = {name: sequence.get(name) for name in _NUCSEQ_FIELDS}
+    response["message"] = message
+    response["sequence"] = sequence_string(sequence)
+    if exclude_none:
+        response = {name: value for name, value in response.items() if value is not None}
+    return _json_response(response)
+
 
 # --- Create Sequence Endpoint ---
 # Accepts a label and DNA sequence from the user, validates both, auto-generates
 # an ID, and saves the new entry to storage. Both nuc_analysed and aa_analysed
 # are set to False by default as no analysis has been performed yet.
+# Analysis fields are all still unset on a new entry, so they are left out of the response.
 @router.post("/", response_model=NucSeq)
 def create_seq_entry(nucseq_input: NucSeqCreate):
-    all_sequences = load_sequences()
-    
-    # Auto-generate a sequential ID based on the current highest ID in storage
-    new_id = max((t["id"] for t in all_sequences), default=0) + 1
-    dna_seq = nucseq_input.sequence.upper()
-    valid_bases = {"A", "T", "G", "C"}
+    # Non-ASCII characters are replaced with "?" so they fail base validation below
+    dna_bytes = nucseq_input.sequence.encode("ascii", "replace").translate(_UPPER)
+    dna_seq = dna_bytes.decode("ascii")
 
     # Validate that a sequence was actually entered
     if len(dna_seq) == 0:
@@ -30,102 +61,107 @@ def create_seq_entry(nucseq_input: NucSeqCreate):
     if len(dna_seq) < 3:
         raise HTTPException(status_code=400, detail="DNA sequence too short to be biologically meaningful. A minimum of 3 nucleotides is required to enter a sequence into the DNA Toolkit. Consider resequencing your sample.")
 
-    # Validate that the sequence only contains valid DNA bases
-    if not set(dna_seq).issubset(valid_bases):
+    # Validate that the sequence only contains valid DNA bases — every byte is mapped to its
+    # 2-bit base code through a 256-entry NumPy lookup table, where invalid bytes map above 3
+    codes = base_codes(dna_bytes)
+    if (codes > 3).any():
         raise HTTPException(status_code=400, detail="Could not create DNA Nucleotide Sequence entry - did not enter a valid series of nucleotides. This must consist only of 'A', 'T', 'C', and 'G'.")
 
-    # Validate that a non-empty label was provided
-    if len(nucseq_input.label.strip()) == 0:
-        raise HTTPException(status_code=400, detail="Could not create DNA Nucleotide Sequence entry - no sequence label was entered. Please try again.")
-
-    # Build the new sequence record and save it to storage
+    # Build the new sequence record and save it to storage, which gives it a sequential ID
+    # based on the current highest ID in storage
+    # Only the 2-bit packed form of the sequence and its length are stored (see storage.py)
     new_nucseq = {
-        "id": new_id,
         "label": nucseq_input.label,
-        "sequence": dna_seq,
+        "packed_sequence": pack_codes(codes),
+        "packed_length": len(dna_seq),
         "nuc_analysed": False,
         "aa_analysed": False
     }
 
-    all_sequences.append(new_nucseq)
-    save_sequences(all_sequences)
-    return {**new_nucseq, "message": "A new DNA Nucleotide sequence has been successfully created and added to the DNA Toolkit. You can search for this entry via its unique ID, displayed below, or perform sequence analyses or an amino acid conversion."}
+    new_nucseq = append_sequence(new_nucseq)
+    return _nucseq_response(new_nucseq, "A new DNA Nucleotide sequence has been successfully created and added to the DNA Toolkit. You can search for this entry via its unique ID, displayed below, or perform sequence analyses or an amino acid conversion.", exclude_none=True)
 
 
 # --- List Sequences Endpoint ---
 # Returns all stored sequences. Supports optional filtering by nuc_analysed and/or
 # aa_analysed status. Both filters can be applied simultaneously.
 # Returns 404 if no sequences are stored, or if filters return no matches.
-@router.get("/", response_model=list[NucSeqSummary])
+# The route has no response_model, so FastAPI never builds or validates NucSeqSummary
+# instances for the list; the model is declared under responses for the API docs only.
+@router.get("/", responses={200: {"model": list[NucSeqSummary]}})
 def list_sequences(nuc_analysed: bool | None = None, aa_analysed: bool | None = None):
-    all_sequences = load_sequences()
+    columns = load_sequences_soa()
+    all_sequences = columns["records"]
 
     # Raised if the toolkit has no sequences stored at all
     if len(all_sequences) == 0:
         raise HTTPException(status_code=404, detail="No nucleotide sequences have been submitted to DNA Toolkit.")
 
-    # Apply nucleotide analysis filter if provided
+    # Apply the nucleotide and/or amino acid analysis filters if provided, as one vectorised
+    # comparison over the analysed-flag columns rather than a Python loop over the records
+    matches = np.ones(len(all_sequences), dtype=bool)
     if nuc_analysed is not None:
-        all_sequences = [seq for seq in all_sequences if seq["nuc_analysed"] == nuc_analysed]
-    
-    # Apply amino acid analysis filter if provided
+        matches &= columns["nuc_analysed"] == nuc_analysed
     if aa_analysed is not None:
-        all_sequences = [seq for seq in all_sequences if seq["aa_analysed"] == aa_analysed]
+        matches &= columns["aa_analysed"] == aa_analysed
+    selected = np.flatnonzero(matches)
 
     # Raised if filters were applied but no sequences matched
-    if len(all_sequences) == 0:
+    if selected.size == 0:
         raise HTTPException(status_code=404, detail="No sequences match the applied filter criteria.")
 
-    return all_sequences
+    return _json_response([_summary(all_sequences[i]) for i in selected.tolist()])
+
+
+# Builds the NucSeqSummary fields of one stored sequence, decoding its sequence string
+def _summary(sequence):
+    return {name: sequence_string(sequence) if name == "sequence" else sequence[name] for name in _SUMMARY_FIELDS}
 
 
 # --- Fetch Sequence by ID Endpoint ---
-# Searches stored sequences for a matching ID and returns the full sequence record.
+# Looks up the stored sequence with a matching ID and returns the full sequence record.
 # Raises 404 if no sequence with the given ID exists.
 @router.get("/{id}", response_model=NucSeq)
 def fetch_sequence_by_ID(id: int):
-    all_sequences = load_sequences()
-    for sequence in all_sequences:
-        if id == sequence["id"]:
-            return {"message": f"DNA Nucleotide Sequence with ID:{id} successfully retrieved.", **sequence}
-    raise HTTPException(status_code=404, detail=f"Could not find sequence entry ID:{id}")
+    sequence = find_sequence(id)
+    if sequence is None:
+        raise HTTPException(status_code=404, detail=f"Could not find sequence entry ID:{id}")
+    return _nucseq_response(sequence, f"DNA Nucleotide Sequence with ID:{id} successfully retrieved.")
 
 
 # --- Delete All Sequences Endpoint ---
-# Overwrites sequences.txt with an empty list, permanently removing all entries.
+# Overwrites sequences.txt with no entries, permanently removing all sequences.
 @router.delete("/")
 def delete_all_sequences():
-    save_sequences([])
+    save_sequences({})
     return {"message": "All entries successfully deleted."}
 
 
 # --- Delete Sequence by ID Endpoint ---
-# Finds the sequence matching the given ID, removes it from the list, and saves
-# the updated list back to storage. Returns the deleted sequence for confirmation.
+# Removes the sequence matching the given ID from storage.
+# Returns the deleted sequence for confirmation.
 # Raises 404 if no sequence with the given ID exists.
 @router.delete("/{id}", response_model=NucSeq)
 def delete_sequence_by_ID(id: int):
-    all_sequences = load_sequences()
-    for sequence in all_sequences:
-        if id == sequence["id"]:
-            all_sequences.remove(sequence)
-            save_sequences(all_sequences)
-            return {"message": f"DNA Nucleotide Sequence with ID:{id} successfully deleted. See details of deleted entry below", **sequence}
-    raise HTTPException(status_code=404, detail=f"Could not delete sequence entry ID:{id} - ID not found")
+    sequence = delete_sequence(id)
+    if sequence is None:
+        raise HTTPException(status_code=404, detail=f"Could not delete sequence entry ID:{id} - ID not found")
+    return _nucseq_response(sequence, f"DNA Nucleotide Sequence with ID:{id} successfully deleted. See details of deleted entry below")
 
 
 # --- Update Sequence Label Endpoint ---
-# Finds the sequence matching the given ID and updates its label.
-# Validates that the new label is not empty before saving.
-# Raises 400 for an empty label, 404 if the ID does not exist.
+# Updates the label of the sequence matching the given ID.
+# Validates that the new label is not empty (it has already been trimmed) before saving.
+# Raises 404 if the ID does not exist, then 400 for an empty label.
 @router.put("/{id}", response_model=NucSeq)
 def update_task_label(id: int, label_input: NucSeqUpdate):
-    all_sequences = load_sequences()
-    for sequence in all_sequences:
-        if id == sequence["id"]:
-            if len(label_input.label.strip()) == 0:
-                raise HTTPException(status_code=400, detail=f"Could not update sequence label for sequence ID:{id} - no sequence label was entered. Please try again.")
-            sequence["label"] = label_input.label
-            save_sequences(all_sequences)
-            return {"message": f"DNA Nucleotide Sequence label successfully updated, for sequence entry with ID:{id}.", **sequence}
-    raise HTTPException(status_code=404, detail=f"Could not update label for sequence ID:{id} - ID not found")
\ No newline at end of file
+    not_found = f"Could not update label for sequence ID:{id} - ID not found"
+    if find_sequence(id) is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    if not label_input.label:
+        raise HTTPException(status_code=400, detail=f"Could not update sequence label for sequence ID:{id} - no sequence label was entered. Please try again.")
+    # Raised as well if the sequence is deleted before the update is made
+    sequence = update_sequence(id, {"label": label_input.label})
+    if sequence is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    return _nucseq_response(sequence, f"DNA Nucleotide Sequence label successfully updated, for sequence entry with ID:{id}.")
\ No newline at end of file
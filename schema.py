@@ -3,21 +3,37 @@
 # FastAPI uses these models to automatically validate incoming data and serialise
 # outgoing responses, rejecting any requests that don't match the defined structure.
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 
 # --- Input Model: Create Sequence ---
 # Defines the fields a user must provide when submitting a new sequence.
 # Field(...) means the field is required — no default value is provided.
+# str_strip_whitespace trims leading/trailing whitespace from both fields during
+# validation (in pydantic-core), before the endpoint sees them.
+# strict=True accepts only JSON strings for both fields, so pydantic-core skips its
+# type-coercion paths rather than trying to convert other input types first.
+# The label must be non-empty once trimmed — checked here, so an empty label is rejected
+# during request validation before the endpoint runs (main.py returns it as a 400).
 class NucSeqCreate(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, strict=True)
+
     label: str = Field(..., description="A label for the DNA sequence")
     sequence: str = Field(..., description="The actual DNA sequence (A, T, C, G)")
 
+    @field_validator("label")
+    @classmethod
+    def label_not_empty(cls, label):
+        if not label:
+            raise ValueError("Could not create DNA Nucleotide Sequence entry - no sequence label was entered. Please try again.")
+        return label
+
 
 # --- Full Sequence Model ---
-# Represents a complete sequence record as stored in sequences.txt and returned
-# by most endpoints. All analysis fields are optional (None by default) since
-# they are only populated after the relevant analysis has been performed.
+# Represents a complete sequence record as returned by most endpoints (sequences.txt
+# stores the sequence in packed form instead — see storage.py). All analysis fields are
+# optional (None by default) since they are only populated after the relevant analysis
+# has been performed.
 class NucSeq(BaseModel):
     message: str | None = None          # Optional response message from the API
     id: int                             # Auto-generated unique identifier
@@ -47,7 +63,12 @@ class NucSeqSummary(BaseModel):
 
 # --- Input Model: Update Sequence Label ---
 # Defines the single field a user provides when updating a sequence label.
+# Leading/trailing whitespace is trimmed and the label must be a string, as for NucSeqCreate.
+# The empty-label check is made by the update endpoint, as its error message names the
+# sequence being updated.
 class NucSeqUpdate(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, strict=True)
+
     label: str
 
 
@@ -2,37 +2,460 @@
 # Handles all file I/O for the DNA Toolkit. Sequences are stored using the JSON Lines
 # format in sequences.txt — one complete JSON object per line. This provides simple
 # persistence across server restarts without requiring a database.
+# The file is read and written in binary mode: orjson parses and produces UTF-8 bytes
+# directly, so no text decoding/encoding layer sits between it and the file.
 
-import json
+import atexit
+import mmap
 import os
+import threading
+import time
+import numpy as np
+import orjson
+from dna_packing import pack2bit, unpack_to_string, encode_packed, decode_packed
 
 # Path to the storage file, relative to the project root
 FILE_PATH = "sequences.txt"
 
+# Path the storage file is rewritten to before it replaces FILE_PATH (see save_sequences)
+TEMP_PATH = FILE_PATH + ".tmp"
+
+# How long (in seconds) the cache is trusted before sequences.txt is checked for changes again
+CACHE_TTL = 0.1
+
+# Minimum number of update/delete entries that must build up in sequences.txt before it is
+# compacted (see _append_entry)
+COMPACT_MIN_ENTRIES = 100
+
+# Appended lines are written to sequences.txt in batches (see flush_now): a batch is written
+# FLUSH_INTERVAL seconds after its first line, or as soon as it holds FLUSH_MAX_PENDING lines
+FLUSH_INTERVAL = 0.01
+FLUSH_MAX_PENDING = 256
+
+
+# --- In-Memory Cache ---
+# Holds the most recently loaded (or saved) sequences, so requests that don't change the
+# store reuse the parsed records instead of re-reading and re-parsing sequences.txt.
+# "sequences" maps each sequence ID to its record, in the order the sequences were created.
+# "key" is the (modification time, size) of sequences.txt when the cache was filled; if
+# the file has changed since, the cache is refilled from disk on the next load. As it
+# tracks the file, it is only changed while _file_lock is held.
+# "columns" holds the columnar view built by load_sequences_soa (rebuilt lazily whenever
+# the sequences change).
+# "checked" is when the key was last compared against the file. Within CACHE_TTL of that,
+# loads skip the check entirely, so a burst of requests shares one stat() of the file.
+# This server's own writes always update the cache directly (see _append_entry), so only
+# changes made to sequences.txt from outside the API can take up to CACHE_TTL to be picked up.
+# "entries" counts the update/delete entries in the file since it was last rewritten.
+# "next_id" is one more than the highest stored sequence ID (see get_next_id).
+_cache = {"key": None, "checked": float("-inf"), "sequences": {}, "columns": None, "entries": 0, "next_id": 1}
+
+# Guards the cache and the queue of pending lines. Sync endpoints run in FastAPI's
+# threadpool, so two requests can reach storage at once; every function here that reads or
+# changes either one holds this lock. It is re-entrant because the write helpers call back
+# into save_sequences.
+_lock = threading.RLock()
+
+# Guards sequences.txt itself. A batch of appended lines is written and synced holding only
+# this lock, so requests — which all take _lock — never wait for the disk. It is always
+# taken while holding _lock (and _lock is never taken while holding it), so the two can't
+# deadlock: flush_now takes it before releasing _lock, so batches reach the file in the
+# order they were queued, and save_sequences takes it to rename the rewritten file into place.
+_file_lock = threading.Lock()
+
+# Lines appended to the store that have not been written to sequences.txt yet, an event
+# that is set while there are any, which wakes the background flusher thread, and an event
+# that is set once FLUSH_MAX_PENDING lines are waiting, which has it write them straight away
+_pending = []
+_has_pending = threading.Event()
+_batch_full = threading.Event()
+_flusher = None
+
+
+# Returns the cache key for the current state of sequences.txt, or None if it doesn't exist
+def _file_key():
+    try:
+        st = os.stat(FILE_PATH)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+# Returns the cache key for a file opened by this module, once everything written to it
+# has been flushed — taken from the open file, so it needs no second lookup of FILE_PATH
+def _written_key(f):
+    f.flush()
+    st = os.fstat(f.fileno())
+    return (st.st_mtime_ns, st.st_size)
+
+
+# Replaces the cached sequences and resets the lookups derived from them
+def _fill_cache(key, sequences, entries=0):
+    _cache["key"] = key
+    _cache["checked"] = time.monotonic()
+    _cache["sequences"] = sequences
+    _cache["columns"] = None
+    _cache["entries"] = entries
+    _cache["next_id"] = max(sequences, default=0) + 1
+
 
 # --- Load Sequences ---
-# Reads sequences.txt and returns all stored sequences as a list of dictionaries.
-# If the file doesn't exist yet (e.g. on first run), returns an empty list
+# Returns all stored sequences, read from sequences.txt, as a dictionary mapping each
+# sequence ID to its record (in creation order), so a single sequence is found by ID
+# without scanning the rest.
+# The parsed records are cached and reused until the file changes on disk, so the same
+# dictionary is returned to every caller — it must only be changed through the functions
+# below, which keep the cache and the file in step.
+# If the file doesn't exist yet (e.g. on first run), returns an empty dictionary
 # rather than raising an error.
 def load_sequences():
-    if not os.path.exists(FILE_PATH):
-        return []
-    sequences = []
-    with open(FILE_PATH, "r") as f:
-        for line in f:
-            line = line.strip()
-            # Skip any blank lines to avoid JSON parse errors
-            if line:
-                sequences.append(json.loads(line))
-    return sequences
+    with _lock:
+        if time.monotonic() - _cache["checked"] < CACHE_TTL:
+            return _cache["sequences"]
+        # While lines are waiting to be written, or a batch is being written, the cache holds
+        # changes the file doesn't yet, so the file is checked on a later load instead —
+        # rather than waiting here for the write, which would hold up every other request
+        if _pending or not _file_lock.acquire(blocking=False):
+            return _cache["sequences"]
+        try:
+            key = _file_key()
+            if key is None:
+                _fill_cache(None, {})
+            elif key != _cache["key"]:
+                sequences, entries = _read_sequences()
+                # Reading may have repaired a torn final line, so the key is taken afterwards
+                _fill_cache(_file_key(), sequences, entries)
+            else:
+                _cache["checked"] = time.monotonic()
+        finally:
+            _file_lock.release()
+        return _cache["sequences"]
+
+
+# --- Find Sequence ---
+# Returns the stored sequence with the given ID, or None if no such sequence exists.
+def find_sequence(id):
+    return load_sequences().get(id)
+
+
+# --- Sequence String ---
+# Stored records hold only the 2-bit packed bases ("packed_sequence", as bytes) and the
+# number of bases ("packed_length"), not the ASCII sequence string — a quarter of the size
+# in memory, and about a third in sequences.txt, where the bytes are base64 encoded.
+# This rebuilds the string for responses that need it.
+def sequence_string(sequence):
+    return unpack_to_string(sequence["packed_sequence"], sequence["packed_length"])
+
+
+# --- Next Sequence ID ---
+# Returns the ID for the next new sequence — one more than the highest stored ID.
+# The value is kept up to date as sequences are loaded, appended and deleted, so creating a
+# sequence doesn't scan every stored ID to find the current highest.
+def get_next_id():
+    with _lock:
+        load_sequences()
+        return _cache["next_id"]
+
+
+# Parses sequences.txt into an id -> record dictionary, replaying the file in order.
+# Lines containing an "_upd" key are update entries written by update_sequence, and lines
+# containing a "_del" key are delete entries written by delete_sequence — these are applied
+# to the matching sequence rather than added as new records.
+# The file is memory-mapped read-only rather than read into a bytes object, and each line
+# is handed to orjson as a memoryview slice of the mapping — so the file's contents are
+# parsed straight from the OS page cache, without first being copied into Python memory.
+# A write cut off part-way (e.g. by a crash during a flush) can leave a torn final line.
+# Such a line is always missing its newline, since every write ends with one. If it can't
+# be parsed it is skipped and truncated from the file; if it parses, the newline is added.
+# Either way, the next append starts on a fresh line instead of running on from the torn one.
+# Returns the sequences and the number of update/delete entries found.
+def _read_sequences():
+    records, torn_at, unterminated = _parse_lines()
+    if torn_at is not None:
+        os.truncate(FILE_PATH, torn_at)
+    elif unterminated:
+        with open(FILE_PATH, "ab") as f:
+            f.write(b"\n")
+
+    by_id = {}
+    entries = 0
+    for record in records:
+        if "_upd" in record:
+            entries += 1
+            target = by_id.get(record.pop("_upd"))
+            if target is not None:
+                target.update(record)
+        elif "_del" in record:
+            entries += 1
+            by_id.pop(record["_del"], None)
+        else:
+            by_id[record["id"]] = _packed_record(record)
+    return by_id, entries
+
+
+# Decodes a record's base64 packed_sequence to the bytes held in memory. A record written
+# by an older version of the toolkit, which stored the ASCII sequence string, is converted
+# to the packed-only form. The next compaction writes it back packed.
+def _packed_record(record):
+    if "sequence" in record:
+        sequence = record.pop("sequence")
+        if "packed_sequence" not in record:
+            record["packed_sequence"] = pack2bit(sequence)
+        record["packed_length"] = len(sequence)
+    if isinstance(record["packed_sequence"], str):
+        record["packed_sequence"] = decode_packed(record["packed_sequence"])
+    return record
+
+
+# Serialises a record or entry as one line of sequences.txt. orjson calls _encode_bytes for
+# the values it can't serialise itself, which base64 encodes the packed_sequence bytes.
+def _dumps_line(record):
+    return orjson.dumps(record, default=_encode_bytes) + b"\n"
+
+
+def _encode_bytes(value):
+    if isinstance(value, bytes):
+        return encode_packed(value)
+    raise TypeError
+
+
+# Whitespace bytes that can start a blank line (JSON lines always start with "{")
+_BLANK_START = b" \t\r"
+
+
+# Parses the JSON object on each line of sequences.txt, in file order.
+# Returns the parsed records, the offset of a torn final line — one that is missing its
+# newline and could not be parsed — (or None), and whether the file's last line is missing
+# its newline. Any other line that can't be parsed raises orjson.JSONDecodeError.
+def _parse_lines():
+    records = []
+    with open(FILE_PATH, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        # An empty file can't be memory-mapped, and holds no records anyway
+        if size == 0:
+            return records, None, False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            start = 0
+            while start < size:
+                end = mm.find(b"\n", start)
+                if end == -1:
+                    end = size
+                # Skip any blank lines to avoid JSON parse errors (orjson itself ignores the
+                # whitespace around a JSON value, so non-blank lines need no stripping)
+                if end > start and not (view[start] in _BLANK_START and mm[start:end].isspace()):
+                    try:
+                        records.append(orjson.loads(view[start:end]))
+                    except orjson.JSONDecodeError:
+                        # Every write ends with a newline, so only a final line without one can
+                        # have been torn; anywhere else this is real corruption
+                        if end < size:
+                            raise
+                        return records, start, False
+                start = end + 1
+            return records, None, mm[size - 1] != ord("\n")
+
+
+# --- Load Sequences (Columnar) ---
+# Returns the stored sequences as parallel columns rather than individual records,
+# so aggregate statistics and filters can be computed with NumPy over whole columns.
+# Numeric analysis fields are float arrays holding NaN for sequences that have not yet
+# had the relevant analysis performed, and the analysed flags are boolean arrays; labels
+# (and the records themselves, under "records") are kept as plain Python lists.
+# The columns are cached alongside the sequences and only rebuilt after the store changes,
+# so a set of columns is never modified once returned.
+def load_sequences_soa():
+    with _lock:
+        load_sequences()
+        if _cache["columns"] is None:
+            sequences = list(_cache["sequences"].values())
+            _cache["columns"] = {
+                "records": sequences,
+                "label": [s["label"] for s in sequences],
+                "nuc_analysed": np.array([s["nuc_analysed"] for s in sequences], dtype=bool),
+                "aa_analysed": np.array([s["aa_analysed"] for s in sequences], dtype=bool),
+                "gc_content": _numeric_column(sequences, "gc_content"),
+                "seq_length": _numeric_column(sequences, "seq_length"),
+                "residue_count": _numeric_column(sequences, "residue_count"),
+            }
+        return _cache["columns"]
+
+
+# Builds a float column for one analysis field, using NaN where the field is missing
+def _numeric_column(sequences, key):
+    values = (s.get(key) for s in sequences)
+    return np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64, count=len(sequences))
 
 
 # --- Save Sequences ---
-# Writes the entire sequence list back to sequences.txt, overwriting the file.
+# Writes the entire id -> record dictionary back to sequences.txt, overwriting the file.
 # Each sequence is serialised as a single JSON object on its own line,
-# maintaining the JSON Lines format. This full rewrite approach ensures
-# data integrity after any create, update, or delete operation.
+# maintaining the JSON Lines format. Any update/delete entries are folded into the
+# records they apply to, leaving a compact file with one line per sequence.
+# The lines are joined into one buffer and written with a single write.
+# Single-record changes use append_sequence, update_sequence and delete_sequence instead.
+# The new file is written to TEMP_PATH, synced to disk, and then renamed over sequences.txt
+# in one atomic step — so a crash part-way through leaves the previous file intact, rather
+# than a truncated one. The directory is then synced too, so the rename itself (and the
+# batches appended to the new file after it) can't be lost to a power failure.
+# The saved dictionary then becomes the cached copy, so the next load doesn't re-read the file.
+# Any lines still waiting to be appended are dropped: the cached sequences being saved
+# already include their changes (or, when deleting everything, replace them).
+# The rename waits for any batch still being written, so that batch can't be appended to
+# the new file after it has replaced the old one.
 def save_sequences(sequences):
-    with open(FILE_PATH, "w") as f:
-        for sequence in sequences:
-            f.write(json.dumps(sequence) + "\n")
\ No newline at end of file
+    with _lock:
+        _pending.clear()
+        _has_pending.clear()
+        _batch_full.clear()
+        with open(TEMP_PATH, "wb") as f:
+            f.write(b"".join([_dumps_line(sequence) for sequence in sequences.values()]))
+            key = _written_key(f)
+            os.fsync(f.fileno())
+        with _file_lock:
+            os.replace(TEMP_PATH, FILE_PATH)
+            _fsync_directory()
+            _fill_cache(key, sequences)
+
+
+# Syncs the directory holding sequences.txt, making a rename within it durable
+def _fsync_directory():
+    fd = os.open(os.path.dirname(os.path.abspath(FILE_PATH)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# --- Append Sequence ---
+# Adds a single new sequence by appending its record to the end of sequences.txt,
+# rather than rewriting the whole file. The sequence is given the next sequence ID while
+# the storage lock is held, so concurrent creates can never be given the same ID.
+# Returns the stored record, including its new ID.
+def append_sequence(fields):
+    with _lock:
+        sequence = {"id": get_next_id(), **fields}
+
+        def add_to_cache():
+            _cache["sequences"][sequence["id"]] = sequence
+            _cache["next_id"] = max(_cache["next_id"], sequence["id"] + 1)
+
+        _append_entry(sequence, add_to_cache)
+        return sequence
+
+
+# --- Update Sequence ---
+# Records changes to a single stored sequence by appending one update entry to the end
+# of sequences.txt, rather than rewriting the whole file. The entry holds the sequence ID
+# under "_upd" plus the changed fields, and is applied when the file is next loaded.
+# The sequence is looked up and changed while the storage lock is held, so a concurrent
+# delete can't remove it in between. If expected is given (a record read earlier), the
+# update is only made if that record is still the one stored under the ID — not deleted,
+# or replaced by a new sequence that has reused the ID, since it was read.
+# Returns the updated record, or None if no such sequence exists (and nothing is written).
+def update_sequence(id, updates, expected=None):
+    with _lock:
+        sequence = load_sequences().get(id)
+        if sequence is None or (expected is not None and sequence is not expected):
+            return None
+        _append_entry({"_upd": id, **updates}, lambda: _cache["sequences"][id].update(updates), counts_as_entry=True)
+        return _cache["sequences"][id]
+
+
+# --- Delete Sequence ---
+# Removes a single stored sequence by appending a delete entry ({"_del": id}) to the end
+# of sequences.txt, rather than rewriting the whole file.
+# As for update_sequence, the sequence is looked up and removed while the storage lock is
+# held, so concurrent deletes of one ID write a single delete entry.
+# Returns the deleted record, or None if no such sequence exists (and nothing is written).
+def delete_sequence(id):
+    with _lock:
+        sequence = load_sequences().get(id)
+        if sequence is None:
+            return None
+
+        # Only deleting the highest ID changes the next ID, and only then are the IDs rescanned
+        def remove_from_cache():
+            del _cache["sequences"][id]
+            if id == _cache["next_id"] - 1:
+                _cache["next_id"] = max(_cache["sequences"], default=0) + 1
+
+        _append_entry({"_del": id}, remove_from_cache, counts_as_entry=True)
+        return sequence
+
+
+# Appends one line to the store and applies the same change to the cached sequences.
+# The cache is brought up to date first and is then authoritative: the line itself is only
+# queued, and written to sequences.txt with the rest of its batch by flush_now.
+# Update and delete entries make the file longer than the data it holds, so once they
+# outnumber both the stored sequences and COMPACT_MIN_ENTRIES, the file is compacted by
+# rewriting it with save_sequences. This keeps rewrites rare — amortised O(1) per write —
+# while bounding the file to roughly twice the size of its live records.
+def _append_entry(entry, apply_to_cache, counts_as_entry=False):
+    with _lock:
+        load_sequences()
+        _pending.append(_dumps_line(entry))
+        apply_to_cache()
+        _cache["columns"] = None
+        _start_flusher()
+        _has_pending.set()
+        if len(_pending) >= FLUSH_MAX_PENDING:
+            _batch_full.set()
+        if counts_as_entry:
+            _cache["entries"] += 1
+            if _cache["entries"] > max(COMPACT_MIN_ENTRIES, len(_cache["sequences"])):
+                save_sequences(_cache["sequences"])
+
+
+# --- Flush Pending Writes ---
+# Writes every queued line to the end of sequences.txt in one write, then syncs the file
+# to disk with a single fsync — so a burst of creates, updates and deletes costs one
+# write and one fsync per batch, rather than an open, write and close per change.
+# The queued lines are taken from the queue holding _lock, but written and synced holding
+# only _file_lock, so other requests carry on while the batch goes to disk.
+# Runs automatically in a background thread (and at exit); call it directly to make sure
+# every change so far is on disk. It must not be called while holding _lock, as it would
+# then hold up other requests while it writes.
+def flush_now():
+    with _lock:
+        batch = b"".join(_pending)
+        _pending.clear()
+        _has_pending.clear()
+        _batch_full.clear()
+        # Taken before _lock is released, so a later batch can't be written before this one
+        _file_lock.acquire()
+    try:
+        if not batch:
+            return
+        cache_current = _cache["key"] == _file_key()
+        with open(FILE_PATH, "ab") as f:
+            f.write(batch)
+            key = _written_key(f)
+            os.fsync(f.fileno())
+        # If sequences.txt was changed from outside the API, the key is left as it was,
+        # so the next load still sees the change and re-reads the file
+        if cache_current:
+            _cache["key"] = key
+    finally:
+        _file_lock.release()
+
+
+# Starts the background flusher thread, the first time anything is queued
+def _start_flusher():
+    global _flusher
+    if _flusher is None:
+        _flusher = threading.Thread(target=_flush_in_background, name="sequences-flusher", daemon=True)
+        _flusher.start()
+
+
+# Waits for lines to be queued, then writes them once FLUSH_INTERVAL has passed (or as soon
+# as FLUSH_MAX_PENDING are waiting), so every change made within that window joins the
+# same batch
+def _flush_in_background():
+    while True:
+        _has_pending.wait()
+        _batch_full.wait(FLUSH_INTERVAL)
+        flush_now()
+
+
+# Anything still queued when the server shuts down is written before it exits
+atexit.register(flush_now)